@@ -1,4 +1,46 @@
 import random
+from collections import deque
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def neighbours_table(height, width):
+    """
+    Returns a dictionary mapping every cell of a height x width board
+    to the frozenset of cells within one row and column of it,
+    not including the cell itself.
+
+    The table is computed once per board size and shared, so it must not be modified.
+    """
+    return {
+        (i, j): frozenset((r, c)
+                          for r in range(max(0, i - 1), min(height, i + 2))
+                          for c in range(max(0, j - 1), min(width, j + 2))
+                          if (r, c) != (i, j))
+        for i in range(height)
+        for j in range(width)
+    }
+
+
+@lru_cache(maxsize=None)
+def bitmask_tables(height, width):
+    """
+    Returns two dictionaries for a height x width board, mapping every cell
+    to its bit i * width + j, and to the bitmask of its neighbours.
+
+    The tables are computed once per board size and shared, so they must not be modified.
+    """
+    bits = {(i, j): 1 << (i * width + j)
+            for i in range(height)
+            for j in range(width)}
+
+    neighbour_masks = {}
+    for cell, neighbours in neighbours_table(height, width).items():
+        neighbour_masks[cell] = 0
+        for neighbour in neighbours:
+            neighbour_masks[cell] |= bits[neighbour]
+
+    return bits, neighbour_masks
 
 
 class Minesweeper:
@@ -13,21 +55,24 @@ class Minesweeper:
         self.width = width
         self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
-
-        # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        # Initialize an empty field with no mines,
+        # stored row by row with one byte per cell: cell (i, j) is self.board[i * width + j]
+        self.board = bytearray(height * width)
+
+        # Add mines randomly, drawing all distinct positions at once
+        for k in random.sample(range(height * width), mines):
+            i, j = divmod(k, width)
+            self.mines.add((i, j))
+            self.board[k] = True
+
+        # Neighbours of every cell, shared by every game of the same board size
+        self._neighbours = neighbours_table(height, width)
+
+        # Mines never move, so count the nearby mines of every cell up front
+        self._nearby = {
+            cell: sum(self.board[i * width + j] for i, j in neighbours)
+            for cell, neighbours in self._neighbours.items()
+        }
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -37,19 +82,20 @@ class Minesweeper:
         Prints a text-based representation
         of where mines are located.
         """
-        for i in range(self.height):
-            print("--" * self.width + "-")
-            for j in range(self.width):
-                if self.board[i][j]:
-                    print("|X", end="")
-                else:
-                    print("| ", end="")
-            print("|")
-        print("--" * self.width + "-")
+        separator = "--" * self.width + "-"
+        lines = []
+        for start in range(0, self.height * self.width, self.width):
+            row = self.board[start:start + self.width]
+            lines.append(separator)
+            lines.append("".join("|X" if mine else "| " for mine in row) + "|")
+        lines.append(separator)
+
+        # Write the whole board at once rather than one cell at a time
+        print("\n".join(lines))
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.board[i * self.width + j])
 
     def nearby_mines(self, cell):
         """
@@ -58,23 +104,7 @@ class Minesweeper:
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        return self._nearby[cell]
 
     def won(self):
         """
@@ -83,56 +113,117 @@ class Minesweeper:
         return self.mines_found == self.mines
 
 
+def split_bits(mask):
+    """
+    Returns the list of single-bit masks of the bits set in a bitmask.
+    """
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low)
+        mask ^= low
+    return bits
+
+
+def count_bits(mask):
+    """
+    Returns the number of bits set in a bitmask.
+    """
+    return bin(mask).count("1")
+
+
 class Sentence:
     """
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    The set of cells is stored as a bitmask: cell (i, j) of a board
+    of width W is bit i * W + j of self.cells.
     """
 
+    # Sentences are created and compared in the AI's hottest loop,
+    # so give them fixed attribute slots instead of an instance dict
+    __slots__ = ("cells", "count", "_hash")
+
     def __init__(self, cells, count):
-        self.cells = set(cells)
+        self.cells = cells
         self.count = count
+        self.rehash()
 
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        return (self._hash == other._hash
+                and self.cells == other.cells and self.count == other.count)
+
+    def __hash__(self):
+        return self._hash
+
+    def rehash(self):
+        """
+        Caches the hash of the sentence. Must be called whenever
+        self.cells or self.count change.
+        """
+        self._hash = hash((self.cells, self.count))
 
     def __str__(self):
-        return f"{self.cells} = {self.count}"
+        return f"{self.cells:b} = {self.count}"
 
     def known_mines(self):
         """
-        Returns the set of all cells in self.cells known to be mines.
+        Returns the bitmask of all cells in self.cells known to be mines.
         """
-        if self.count == len(self.cells):
+        if self.count == count_bits(self.cells):
             return self.cells
         else:
-            return set()
+            return 0
 
     def known_safes(self):
         """
-        Returns the set of all cells in self.cells known to be safe.
+        Returns the bitmask of all cells in self.cells known to be safe.
         """
         if self.count == 0:
             return self.cells
         else:
-            return set()
+            return 0
 
-    def mark_mine(self, cell):
+    def mark_mine(self, mask):
         """
         Updates internal knowledge representation given the fact that
-        a cell is known to be a mine.
+        the cells in the given bitmask are known to be mines.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
-            self.count -= 1
+        overlap = self.cells & mask
+        if overlap:
+            self.cells ^= overlap
+            self.count -= count_bits(overlap)
+            self.rehash()
 
-    def mark_safe(self, cell):
+    def mark_safe(self, mask):
         """
         Updates internal knowledge representation given the fact that
-        a cell is known to be safe.
+        the cells in the given bitmask are known to be safe.
         """
-        self.cells.discard(cell)
+        overlap = self.cells & mask
+        if overlap:
+            self.cells ^= overlap
+            self.rehash()
+
+
+def subset_inferences(sentence, knowledge):
+    """
+    Yields the sentences inferred from `sentence` and each sentence
+    of knowledge when one of them is a subset of the other.
+    """
+    for other in knowledge:
+        for subset, superset in ((sentence, other), (other, sentence)):
+            # Rule pairs out by counts and sizes before the mask test: a strict subset
+            # with more than one cell can't hold more mines or cells than its superset
+            if (subset.count <= superset.count
+                    and 1 < count_bits(subset.cells) < count_bits(superset.cells)
+                    and subset.cells & ~superset.cells == 0):
+                # The inferred set with elements in the superset that are not in the subset.
+                # The inferred count is the superset count minus the subset count
+                yield Sentence(superset.cells & ~subset.cells,
+                               superset.count - subset.count)
 
 
 class MinesweeperAI:
@@ -153,26 +244,101 @@ class MinesweeperAI:
         self.mines = set()
         self.safes = set()
 
+        # Safe cells that haven't been chosen yet, and cells that are neither chosen nor mines
+        self._safe_unmade = set()
+        self._candidates = {(i, j) for i in range(height) for j in range(width)}
+
         # List of sentences about the game known to be true
         self.knowledge = []
 
+        # Sentences added or changed since they were last compared with the others
+        self._dirty = []
+
+        # Masks of cells known to be mines (True) or safe (False) that are yet to be marked
+        self._pending = deque()
+
+        # Bit of every cell in the sentences' bitmasks and bitmask of its neighbours,
+        # shared by every game of the same board size
+        self._bits, self._neighbour_masks = bitmask_tables(height, width)
+
+        # Bitmasks of the cells known to be mines or safe, mirroring self.mines and self.safes
+        self._mine_mask = 0
+        self._safe_mask = 0
+
+        # Sentences of knowledge by the bits of the cells they contain, keyed by identity
+        # since sentences are changed in place while they are indexed
+        self._cell_index = {bit: {} for bit in self._bits.values()}
+
+    def to_cells(self, mask):
+        """
+        Returns the list of cells whose bits are set in a bitmask.
+        """
+        return [divmod(bit.bit_length() - 1, self.width) for bit in split_bits(mask)]
+
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        self.mark_cells(self._bits[cell], 0)
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
+        self.mark_cells(0, self._bits[cell])
+
+    def mark_cells(self, mines, safes):
+        """
+        Marks the cells of the `mines` bitmask as mines and the cells of
+        the `safes` bitmask as safe, updating all knowledge in a single pass.
+        Sentences left empty are dropped, the others are queued to be
+        compared again and checked for newly known mines or safes.
+        """
+        marked = mines | safes
+        if not marked:
+            return
+
+        for mine in self.to_cells(mines):
+            self.mines.add(mine)
+            self._candidates.discard(mine)
+        for safe_cell in self.to_cells(safes):
+            self.safes.add(safe_cell)
+            if safe_cell not in self.moves_made:
+                self._safe_unmade.add(safe_cell)
+        self._mine_mask |= mines
+        self._safe_mask |= safes
+
+        knowledge = []
         for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+            overlap = sentence.cells & marked
+            if overlap:
+                self.unindex_sentence(sentence, overlap)
+                sentence.mark_mine(mines)
+                sentence.mark_safe(safes)
+                if not sentence.cells:
+                    continue
+                self._dirty.append(sentence)
+                self.check_trivial(sentence)
+            knowledge.append(sentence)
+        self.knowledge = knowledge
+
+    def check_trivial(self, sentence):
+        """
+        Queues the cells of a sentence to be marked
+        if they are all known to be mines or all known to be safe.
+        """
+        # The masks are immutable snapshots of the cells, so they can be queued without copying.
+        # A non-empty sentence can't be all safe and all mines, so stop at the first match
+        known_safes = sentence.known_safes()
+        if known_safes:
+            self._pending.append((False, known_safes))
+            return
+
+        known_mines = sentence.known_mines()
+        if known_mines:
+            self._pending.append((True, known_mines))
 
     def add_knowledge(self, cell, count):
         """
@@ -190,45 +356,104 @@ class MinesweeperAI:
                if they can be inferred from existing knowledge
         """
         self.moves_made.add(cell)
+        self._safe_unmade.discard(cell)
+        self._candidates.discard(cell)
         self.mark_safe(cell)
         self.add_neighbours_sentence(cell, count)
 
-        updated = True
-        # loop until there is nothing to be done by
-        while updated:
-            # Reset flag to false to track that there is something to be done or not
-            updated = False
-
-            # iterate over all possible pairs of sentence
-            for sentence1 in self.knowledge:
-                for sentence2 in self.knowledge:
-                    # Infer new sentence if one sentence is subset of the other one
-                    if sentence1 != sentence2 and len(sentence1.cells) > 1 and sentence1.cells < sentence2.cells:
-                        # The inferred set with elements in the second set that are not in the first one.
-                        # The inferred count is the second count minus the first
-                        concluded_sentence = Sentence(sentence2.cells - sentence1.cells,
-                                                      sentence2.count - sentence1.count)
-
-                        # Add the new sentence to knowledge if it hadn't inferred before
-                        if concluded_sentence not in self.knowledge:
-                            self.knowledge.append(concluded_sentence)
-                            updated = True
-
-            # Infer mine cells or safe cells
-            for sentence in self.knowledge:
-                # Make a copy of known_mines not to modify the set while iterating over it
-                known_mines = sentence.known_mines().copy()
-                if len(known_mines) > 0:
-                    for mine in known_mines:
-                        self.mark_mine(mine)
-                    updated = True
-
-                # Make a copy of known_safes not to modify the set while iterating over it
-                know_safes = sentence.known_safes().copy()
-                if len(know_safes) > 0:
-                    for safe_cell in know_safes:
-                        self.mark_safe(safe_cell)
-                    updated = True
+        # loop until no sentence has changed since it was last compared with the others
+        # and every known mine or safe cell has been marked
+        while self._dirty or self._pending:
+            # Mark cells of sentences that became trivial when they were added or reduced
+            while self._pending:
+                # Collect everything that is pending and mark it in one pass over knowledge
+                mines = safes = 0
+                while self._pending:
+                    is_mine, mask = self._pending.popleft()
+                    if is_mine:
+                        mines |= mask
+                    else:
+                        safes |= mask
+
+                # Marking may reduce more sentences to known mines or safes, queueing the next batch
+                self.mark_cells(mines & ~self._mine_mask, safes & ~self._safe_mask)
+
+            # Marking cells can turn different sentences into the same one, so drop duplicates
+            # and keep a hashed set of the sentences to find new duplicates without a linear scan
+            known = self.purge_knowledge()
+
+            # Only pairs involving a new or changed sentence can infer anything new
+            dirty, self._dirty = self._dirty, []
+            for position, sentence1 in enumerate(dirty):
+                # Once an inference gives known mines or safes, stop and mark them first,
+                # so the remaining sentences are compared with the reduced knowledge
+                if self._pending:
+                    self._dirty.extend(dirty[position:])
+                    break
+
+                # Only sentences sharing a cell with sentence1 can be its subset or superset
+                candidates = {}
+                for bit in split_bits(sentence1.cells):
+                    candidates.update(self._cell_index[bit])
+
+                for concluded_sentence in subset_inferences(sentence1, candidates.values()):
+                    # Add the new sentence to knowledge if it hadn't inferred before
+                    if concluded_sentence not in known:
+                        known.add(concluded_sentence)
+                        self.add_sentence(concluded_sentence)
+
+    def purge_knowledge(self):
+        """
+        Removes duplicate sentences from knowledge, keeping the first of each,
+        and returns the set of the remaining sentences. Sentences no longer in
+        knowledge are dropped from the worklist too, since marking cells doesn't
+        update them anymore.
+
+        A sentence that strictly contains another one with the same count is
+        not removed here: the pair inference concludes that the extra cells are
+        safe, after which it reduces to a duplicate and is removed then.
+        """
+        unique = {}
+        for sentence in self.knowledge:
+            if sentence in unique:
+                self.unindex_sentence(sentence, sentence.cells)
+            else:
+                unique[sentence] = None
+
+        self.knowledge = list(unique)
+
+        kept = {id(sentence) for sentence in self.knowledge}
+        self._dirty = [sentence for sentence in self._dirty if id(sentence) in kept]
+
+        return set(unique)
+
+    def index_sentence(self, sentence):
+        """
+        Adds a sentence to the index of sentences by the cells they contain.
+        """
+        for bit in split_bits(sentence.cells):
+            self._cell_index[bit][id(sentence)] = sentence
+
+    def unindex_sentence(self, sentence, mask):
+        """
+        Removes a sentence from the index entries of the cells in the given bitmask.
+        """
+        for bit in split_bits(mask):
+            del self._cell_index[bit][id(sentence)]
+
+    def add_sentence(self, sentence):
+        """
+        Adds a sentence to knowledge, queues it to be compared
+        with the other sentences and checks it for known mines or safes.
+        Empty sentences carry no information and are ignored.
+        """
+        if not sentence.cells:
+            return
+
+        self.knowledge.append(sentence)
+        self._dirty.append(sentence)
+        self.index_sentence(sentence)
+        self.check_trivial(sentence)
 
     def add_neighbours_sentence(self, cell, count):
         """
@@ -236,27 +461,16 @@ class MinesweeperAI:
         :param cell: cell that is recently moved to
         :param count: number of mines around this cell
         """
-        neighbour_cells = set()
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
+        neighbours = self._neighbour_masks[cell]
 
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Add the cell to neighbours if cell in bounds
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    # Neglect cell that is mine and reduce count by 1
-                    if (i, j) in self.mines:
-                        count -= 1
+        # Neglect cells that are mines and reduce count by their number
+        count -= count_bits(neighbours & self._mine_mask)
 
-                    # Neglect cell that is safe and add other cells
-                    elif (i, j) not in self.safes:
-                        neighbour_cells.add((i, j))
+        # Neglect cells that are safe and add other cells
+        neighbour_cells = neighbours & ~self._mine_mask & ~self._safe_mask
 
         # Add new sentence to knowledge
-        self.knowledge.append(Sentence(neighbour_cells, count))
+        self.add_sentence(Sentence(neighbour_cells, count))
 
     def make_safe_move(self):
         """
@@ -267,12 +481,8 @@ class MinesweeperAI:
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        # iterate over safe moves and return the first move that hasn't made yet
-        for move in self.safes:
-            if move not in self.moves_made:
-                return move
-
-        return None
+        # Return any safe move that hasn't made yet
+        return next(iter(self._safe_unmade), None)
 
     def make_random_move(self):
         """
@@ -282,13 +492,8 @@ class MinesweeperAI:
             2) are not known to be mines
         """
         # When all the possible moves are made or mine, then there is no possible random move
-        if len(self.moves_made) + len(self.mines) == self.height * self.width:
+        if not self._candidates:
             return None
 
-        # Choose random move tha haven't made yet
-        while True:
-            random_move = (random.randrange(self.height),
-                           random.randrange(self.width))
-
-            if random_move not in self.moves_made and random_move not in self.mines:
-                return random_move
+        # Choose random move among the cells that haven't made yet and aren't mines
+        return random.choice(tuple(self._candidates))